@@ -4,21 +4,24 @@ lambda_handler.py - Fish Finder Lambda Worker
 Serverless replacement for ec2_worker.py.
 Triggered by SQS (see lambda.tf - aws_lambda_event_source_mapping).
 
-One Lambda invocation = one SQS message = one fish image processed.
-SQS handles retries automatically on failure (no polling loop needed).
+One Lambda invocation = up to 10 SQS messages (batch_size in lambda.tf),
+classified in a single batched forward pass. SQS handles retries
+automatically on failure (no polling loop needed).
 
 Environment variables (set in lambda.tf):
     TABLE_NAME      - DynamoDB results table name
     SNS_TOPIC_ARN   - SNS topic ARN for notifications
     AWS_REGION_NAME - AWS region (avoid conflict with Lambda's built-in AWS_REGION)
 """
+import io
 import json
 import os
 import boto3
-from pathlib import Path
+from boto3.s3.transfer import TransferConfig
 from urllib.parse import unquote_plus
 
 # model_logic and fish_dictionary are in the same directory in the container
+from fish_dictionary import MIN_SIZE_DISPLAY, SNS_SUBJECT, SNS_TEMPLATE
 from model_logic import FishClassifier
 
 # --- Configuration from Lambda environment variables ---
@@ -32,6 +35,16 @@ sns      = boto3.client("sns",      region_name=AWS_REGION)
 dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
 table    = dynamodb.Table(TABLE_NAME)
 
+# A single S3 stream inside Lambda caps at ~45-58 MB/s; multipart ranged GETs
+# fetch large high-res photos in parallel parts. Small images (most phone
+# uploads) stay below the threshold and use a plain single GET.
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=512 * 1024,
+    multipart_chunksize=512 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
+
 # Load the ML model once at container startup (cold start ~10-15s, warm ~0s)
 print("[Lambda] Loading FishClassifier model...")
 classifier = FishClassifier()
@@ -40,21 +53,60 @@ print("[Lambda] Model ready.")
 
 def handler(event, context):
     """
-    Lambda entry point. Called once per SQS batch (batch_size=1 in lambda.tf).
+    Lambda entry point. Called with up to batch_size=10 records (see lambda.tf).
+
+    Records are parsed, deduplicated and fetched individually, then every
+    surviving image goes through one batched forward pass - CPU inference is
+    dominated by fixed per-call overhead, so classifying the whole SQS batch
+    together amortises it across the records.
 
-    If this function raises an exception, SQS will make the message visible
-    again for retry (up to maximum_retry_attempts set in the event source mapping).
+    Returns a batchItemFailures list so SQS only retries the records that
+    actually failed - an empty list acknowledges the whole batch. One bad
+    image no longer forces the successful records through a redelivery.
     """
     print(f"[Lambda] Received event with {len(event['Records'])} record(s)")
 
-    for record in event["Records"]:
-        process_record(record)
-
-    return {"statusCode": 200, "body": "OK"}
+    failures = []
 
+    # Phase 1: parse, dedup and fetch per record - a bad message only fails
+    # its own itemIdentifier
+    jobs = []
+    for record in event["Records"]:
+        try:
+            job = fetch_record(record)
+            if job is not None:
+                jobs.append(job)
+        except Exception as e:
+            print(f"[Lambda] ❌ Record {record.get('messageId')} failed: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    if not jobs:
+        return {"batchItemFailures": failures}
+
+    # Phase 2: one forward pass over all surviving images. predict_batch
+    # returns an error placeholder for images that fail to decode, so a bad
+    # image doesn't take the batch down.
+    print(f"[Lambda]   Running inference on {len(jobs)} image(s)...")
+    predictions = classifier.predict_batch([job["image_bytes"] for job in jobs])
+
+    # Phase 3: store + notify per record, keeping per-record failure attribution
+    for job, prediction in zip(jobs, predictions):
+        try:
+            store_result(job["key"], prediction)
+        except Exception as e:
+            print(f"[Lambda] ❌ Record {job['message_id']} failed: {e}")
+            failures.append({"itemIdentifier": job["message_id"]})
+
+    return {"batchItemFailures": failures}
+
+
+def fetch_record(record):
+    """
+    Parse one SQS record and fetch its image from S3.
 
-def process_record(record):
-    """Process a single SQS record containing an S3 event notification."""
+    Returns a job dict for the inference batch, or None when the record needs
+    no processing (unrecognised message or duplicate delivery).
+    """
     body = json.loads(record["body"])
 
     # SQS sometimes wraps S3 events in an SNS envelope
@@ -63,7 +115,7 @@ def process_record(record):
 
     if "Records" not in body:
         print(f"[Lambda] Skipping unrecognised message: {list(body.keys())}")
-        return
+        return None
 
     s3_record = body["Records"][0]["s3"]
     bucket    = s3_record["bucket"]["name"]
@@ -71,58 +123,92 @@ def process_record(record):
     key       = unquote_plus(s3_record["object"]["key"])
     print(f"[Lambda] Processing: s3://{bucket}/{key}")
 
-    # Download image to /tmp (Lambda ephemeral storage, max 512MB by default)
-    tmp_path = f"/tmp/{Path(key).name}"
-    print(f"[Lambda]   Downloading to {tmp_path}...")
-    s3.download_file(bucket, key, tmp_path)
-
-    try:
-        # Run ML inference and get confidence score for logging
-        print("[Lambda]   Running inference...")
-        species_en, data, confidence = classifier.predict(tmp_path)
-        print(f"[Lambda]   Result: {species_en} (confidence: {confidence:.1%})")
-    finally:
-        # Clean up /tmp to avoid filling the 512MB limit across warm invocations
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-
-    # Format min_size: show Hebrew "no minimum" when None, otherwise "<N> cm"
+    # SQS redelivers a message when a previous attempt ran past the visibility
+    # timeout, so the same key can arrive twice. Re-running inference and
+    # re-publishing SNS would spam subscribers and double the compute cost -
+    # if a result is already stored for this key, the work is done.
+    existing = table.get_item(Key={"ImageId": key}, ProjectionExpression="ImageId, Confidence")
+    if "Item" in existing:
+        print(f"[Lambda] Duplicate delivery - result already stored "
+              f"(confidence: {existing['Item'].get('Confidence', '?')}). Skipping: {key}")
+        return None
+
+    # Stream the image straight into memory - no /tmp round-trip, no cleanup,
+    # and no pressure on the 512MB ephemeral storage shared by warm invocations
+    print("[Lambda]   Fetching image from S3...")
+    buf = io.BytesIO()
+    s3.download_fileobj(bucket, key, buf, Config=S3_TRANSFER_CONFIG)
+    return {
+        "message_id":  record["messageId"],
+        "key":         key,
+        "image_bytes": buf.getvalue(),
+    }
+
+
+def store_result(key, prediction):
+    """Write one inference result to DynamoDB and publish its SNS notification."""
+    species_en, data, confidence = prediction
+    print(f"[Lambda]   Result: {species_en} (confidence: {confidence:.1%})")
+
+    # Display string ("no minimum" in Hebrew when None, otherwise "<N> cm") is
+    # precomputed per species at import time in fish_dictionary. The .get
+    # fallback only triggers for the classifier's "Error" placeholder result.
     raw_min_size = data["regulations"]["min_size_cm"]
-    min_size_display = "אין גודל מינימלי" if raw_min_size is None else f"{raw_min_size} ס״מ"
+    min_size_display = MIN_SIZE_DISPLAY.get(species_en, f"{raw_min_size} ס״מ")
 
-    # Save result to DynamoDB - ImageId is the primary key polled by the webapp
+    # Save result to DynamoDB - ImageId is the primary key polled by the webapp.
+    # The conditional write closes the race the get_item pre-check can't: two
+    # concurrent invocations of the same key can both pass that check, but
+    # only one wins this put - the loser treats it as a duplicate and skips
+    # the SNS publish instead of spamming subscribers twice.
     print("[Lambda]   Writing to DynamoDB...")
-    table.put_item(Item={
-        "ImageId":      key,
-        "Species":      species_en,
-        "HebrewName":   data["name"],
-        "NativeStatus": data["native_status"],
-        "Population":   data["population_status"],
-        "AvgSizeCM":    data["avg_size_cm"],
-        "MinSizeCM":    raw_min_size if raw_min_size is not None else 0,
-        "MinSizeDisplay": min_size_display,
-        "SeasonalBan":  data["regulations"]["seasonal_ban"],
-        "Notes":        data["regulations"]["notes"],
-        "Description":  data["description"],
-        "Confidence":   str(round(confidence, 4)),
-        "NeedsReview":  confidence < 0.70,
-    })
-
-    # Publish Hebrew notification via SNS
-    ban_status   = "פעיל" if data["regulations"]["seasonal_ban"] else "לא פעיל"
-    conf_str     = f"{confidence:.0%}"
-    message_text = (
-        f"זיהוי: {data['name']} ({species_en}) - ביטחון: {conf_str}\n"
-        f"סטטוס: {data['native_status']} | {data['population_status']}\n"
-        f"גודל מינימלי: {min_size_display}\n"
-        f"איסור עונתי: {ban_status}\n"
-        f"הערות: {data['regulations']['notes']}"
-    )
+    try:
+        table.put_item(
+            Item={
+                "ImageId":      key,
+                "Species":      species_en,
+                "HebrewName":   data["name"],
+                "NativeStatus": data["native_status"],
+                "Population":   data["population_status"],
+                "AvgSizeCM":    data["avg_size_cm"],
+                "MinSizeCM":    raw_min_size if raw_min_size is not None else 0,
+                "MinSizeDisplay": min_size_display,
+                "SeasonalBan":  data["regulations"]["seasonal_ban"],
+                "Notes":        data["regulations"]["notes"],
+                "Description":  data["description"],
+                "Confidence":   str(round(confidence, 4)),
+                "NeedsReview":  confidence < 0.70,
+            },
+            ConditionExpression="attribute_not_exists(ImageId)",
+        )
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"[Lambda] Concurrent duplicate - result already written. Skipping SNS: {key}")
+        return
+
+    # Publish Hebrew notification via SNS. The message body is precomputed per
+    # species at import time - only the confidence is substituted per request.
+    # The classifier's "Error" placeholder has no template, so that path still
+    # builds the message inline.
+    conf_str = f"{confidence:.0%}"
+    if species_en in SNS_TEMPLATE:
+        message_text = SNS_TEMPLATE[species_en] % conf_str
+        subject      = SNS_SUBJECT[species_en]
+    else:
+        ban_status   = "פעיל" if data["regulations"]["seasonal_ban"] else "לא פעיל"
+        message_text = (
+            f"זיהוי: {data['name']} ({species_en}) - ביטחון: {conf_str}\n"
+            f"סטטוס: {data['native_status']} | {data['population_status']}\n"
+            f"גודל מינימלי: {min_size_display}\n"
+            f"איסור עונתי: {ban_status}\n"
+            f"הערות: {data['regulations']['notes']}"
+        )
+        subject = f"תוצאה: {data['name']}"
+
     print("[Lambda]   Sending SNS notification...")
     sns.publish(
         TopicArn=SNS_TOPIC_ARN,
         Message=message_text,
-        Subject=f"תוצאה: {data['name']}"
+        Subject=subject
     )
 
     print(f"[Lambda] ✅ Done: {key} → {species_en}")
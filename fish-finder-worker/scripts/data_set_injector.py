@@ -1,12 +1,100 @@
-import requests
+import concurrent.futures
 import json
+import shutil
+import sqlite3
+import threading
 import time
 from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from fish_dictionary import FISH_DATA
 
 BASE_URL = "https://api.inaturalist.org/v1/observations"
 MAX_IMAGES = 50
 PER_PAGE = 50  # max allowed per API call
+MAX_WORKERS = 8
+
+# One pooled session for every request - reusing the TCP+TLS connections to
+# api/static.inaturalist.org saves a ~100-300ms handshake per image.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    ),
+)
+
+
+class RateLimiter:
+    """Spaces requests evenly across all download threads.
+
+    Replaces the old per-image time.sleep(0.4): with concurrent downloads a
+    sleep inside each thread no longer limits the aggregate rate, so threads
+    reserve evenly-spaced slots from a shared schedule instead (iNaturalist
+    asks for roughly 1 request/second).
+    """
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+RATE_LIMITER = RateLimiter(interval=1.0)
+
+# Persistent URL dedup: the same iNaturalist photo can appear under sibling
+# taxa, and re-runs of the injector should skip what's already on disk. A
+# tiny SQLite DB next to the dataset replaces the old per-species in-memory
+# set, making builds incremental/resumable.
+SEEN_DB = None
+
+
+def init_seen_db(base_path: Path):
+    global SEEN_DB
+    SEEN_DB = sqlite3.connect(str(base_path / "seen_urls.db"))
+    SEEN_DB.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY, path TEXT)")
+
+    # Claims are committed before downloads start, so a crash or Ctrl+C
+    # mid-download leaves rows whose file never landed. Drop any claim whose
+    # path is missing on disk so those photos are retried instead of being
+    # skipped forever.
+    stale = [
+        (url,)
+        for url, path in SEEN_DB.execute("SELECT url, path FROM seen")
+        if not Path(path).exists()
+    ]
+    if stale:
+        SEEN_DB.executemany("DELETE FROM seen WHERE url = ?", stale)
+        print(f"Released {len(stale)} stale claim(s) with no file on disk.")
+
+    SEEN_DB.commit()
+
+
+def claim_url(url, path):
+    """Record a photo URL; returns False if it was already claimed (skip it)."""
+    try:
+        SEEN_DB.execute("INSERT INTO seen VALUES (?, ?)", (url, str(path)))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+
+def release_url(url):
+    """Drop a claim whose download failed, so the next run retries it."""
+    SEEN_DB.execute("DELETE FROM seen WHERE url = ?", (url,))
 
 
 def get_observations(species_name):
@@ -19,7 +107,8 @@ def get_observations(species_name):
         "order_by": "created_at"
     }
 
-    response = requests.get(BASE_URL, params=params, timeout=15)
+    RATE_LIMITER.wait()
+    response = SESSION.get(BASE_URL, params=params, timeout=15)
     response.raise_for_status()
     return response.json()
 
@@ -34,10 +123,46 @@ def get_best_photo_url(photo_obj):
 
 
 def download_image(url, path):
-    img = requests.get(url, timeout=15)
-    img.raise_for_status()
-    with open(path, "wb") as f:
-        f.write(img.content)
+    # Stream in 64KB chunks straight to disk instead of buffering the whole
+    # payload in memory (img.content) and writing it afterwards - peak memory
+    # stays bounded per thread and the network receive overlaps the disk write.
+    RATE_LIMITER.wait()
+    with SESSION.get(url, stream=True, timeout=15) as img:
+        img.raise_for_status()
+        with open(path, "wb") as f:
+            shutil.copyfileobj(img.raw, f, length=65536)
+
+
+def download_photo(species_name, species_path: Path, image_number, photo_url, observation):
+    """Download one photo plus its metadata sidecar. Returns True on success."""
+    image_path = species_path / f"{image_number}.jpg"
+    metadata_path = species_path / f"{image_number}.json"
+
+    try:
+        print(f"Downloading {image_number}: {photo_url}")
+        download_image(photo_url, image_path)
+
+        metadata = {
+            "species": species_name,
+            "observation_id": observation.get("id"),
+            "observed_on": observation.get("observed_on"),
+            "location": observation.get("location"),
+            "photo_url": photo_url,
+            "observer": observation.get("user", {}).get("login"),
+        }
+
+        with open(metadata_path, "w") as meta_file:
+            json.dump(metadata, meta_file, indent=2)
+
+        return True
+
+    except Exception as e:
+        print(f"Skipping image due to error: {e}")
+        # Don't leave a partial image behind - a truncated jpg would poison
+        # the training set and block this slot number on the next run
+        image_path.unlink(missing_ok=True)
+        metadata_path.unlink(missing_ok=True)
+        return False
 
 
 def download_species(species_name, base_path: Path):
@@ -46,6 +171,9 @@ def download_species(species_name, base_path: Path):
     species_path = base_path / species_name
     species_path.mkdir(parents=True, exist_ok=True)
 
+    if SEEN_DB is None:
+        init_seen_db(base_path)
+
     try:
         data = get_observations(species_name)
     except Exception as e:
@@ -56,55 +184,68 @@ def download_species(species_name, base_path: Path):
         print(f"No results found for {species_name}")
         return
 
-    image_count = 0
-    seen_urls = set()
+    # Resume numbering after whatever earlier runs left on disk - restarting
+    # at 1 would overwrite previously downloaded images on a re-run
+    existing = [int(p.stem) for p in species_path.glob("*.jpg") if p.stem.isdigit()]
+    next_number = max(existing, default=0) + 1
+
+    # Collect the download jobs first (dedup + MAX_IMAGES cap), then fetch
+    # them in parallel - the rate limiter keeps the aggregate request rate
+    # polite while the threads hide per-image latency.
+    jobs = []
 
     for observation in data["results"]:
-        if image_count >= MAX_IMAGES:
+        if len(jobs) >= MAX_IMAGES:
             break
 
         for photo in observation.get("photos", []):
-            if image_count >= MAX_IMAGES:
+            if len(jobs) >= MAX_IMAGES:
                 break
 
             photo_url = get_best_photo_url(photo)
-            if not photo_url or photo_url in seen_urls:
+            if not photo_url:
                 continue
 
-            try:
-                image_count += 1
-                seen_urls.add(photo_url)
-
-                image_path = species_path / f"{image_count}.jpg"
-                metadata_path = species_path / f"{image_count}.json"
-
-                print(f"Downloading {image_count}: {photo_url}")
-                download_image(photo_url, image_path)
+            # Skips duplicates within this run AND anything a previous run
+            # (or a sibling species) already downloaded
+            number = next_number + len(jobs)
+            image_path = species_path / f"{number}.jpg"
+            if not claim_url(photo_url, image_path):
+                continue
 
-                metadata = {
-                    "species": species_name,
-                    "observation_id": observation.get("id"),
-                    "observed_on": observation.get("observed_on"),
-                    "location": observation.get("location"),
-                    "photo_url": photo_url,
-                    "observer": observation.get("user", {}).get("login"),
-                }
+            jobs.append((number, photo_url, observation))
 
-                with open(metadata_path, "w") as meta_file:
-                    json.dump(metadata, meta_file, indent=2)
+    # One commit per species keeps the dedup durable without per-URL fsyncs
+    SEEN_DB.commit()
 
-                time.sleep(0.4)  # polite API usage
+    downloaded = 0
+    failed_urls = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(download_photo, species_name, species_path, number, url, observation): url
+            for number, url, observation in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                downloaded += 1
+            else:
+                failed_urls.append(futures[future])
 
-            except Exception as e:
-                print(f"Skipping image due to error: {e}")
-                continue
+    # Release the claims of failed downloads so the next run retries them.
+    # Done here rather than in the workers because the sqlite connection
+    # belongs to the main thread.
+    if failed_urls:
+        for url in failed_urls:
+            release_url(url)
+        SEEN_DB.commit()
 
-    print(f"Downloaded {image_count} images for {species_name}")
+    print(f"Downloaded {downloaded} images for {species_name}")
 
 
 if __name__ == "__main__":
     base_path = Path("..") / "dataset"
     base_path.mkdir(parents=True, exist_ok=True)
+    init_seen_db(base_path)
 
     for fish in FISH_DATA:
         download_species(fish, base_path)
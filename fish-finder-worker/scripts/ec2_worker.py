@@ -1,6 +1,10 @@
 import boto3
+import concurrent.futures
+import io
 import json
 import os
+from boto3.s3.transfer import TransferConfig
+from fish_dictionary import SNS_SUBJECT, SNS_TEMPLATE
 from model_logic import FishClassifier
 
 # --- CONFIGURATION ---
@@ -33,101 +37,218 @@ s3       = boto3.client('s3',       region_name=AWS_REGION)
 sns      = boto3.client('sns',      region_name=AWS_REGION)
 dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
 
+# A single S3 stream caps at ~45-58 MB/s; multipart ranged GETs download large
+# high-res photos in parallel parts. Images below the threshold (most phone
+# uploads) use a plain single GET - no overhead for the common case.
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=512 * 1024,
+    multipart_chunksize=512 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
 
-def process_fish():
-    """Poll SQS for one message, run ML inference, store result, notify via SNS."""
+
+def poll_and_fetch():
+    """
+    Poll SQS for a batch of messages and stream their images into memory.
+
+    This is the I/O-only half of the pipeline: it never touches the model, so
+    the main loop can run it in the background while the previous batch is
+    being inferred and published.
+
+    Returns (downloaded_jobs, delete_entries).
+    """
 
     # 1. Long Poll SQS (waits up to 20s if queue is empty - saves API cost)
+    # Fetching up to 10 messages per poll lets us batch the forward pass below,
+    # which amortises the fixed per-call inference overhead on CPU.
     print("Polling SQS for messages...")
     response = sqs.receive_message(
         QueueUrl=QUEUE_URL,
         WaitTimeSeconds=20,
-        MaxNumberOfMessages=1
+        MaxNumberOfMessages=10
     )
 
     if 'Messages' not in response:
         # Perfectly normal - just means the queue was empty during the poll window
         print("No messages this poll cycle.")
+        return [], []
+
+    # 2. Parse all messages up front, collecting (receipt_handle, bucket, key) jobs
+    jobs           = []
+    delete_entries = []  # Messages to remove from the queue once handled
+
+    for msg in response['Messages']:
+        body = json.loads(msg['Body'])
+
+        # SQS sometimes wraps the S3 event in an SNS envelope - handle both formats
+        if 'Message' in body:
+            # SNS-wrapped format: body['Message'] is a JSON string containing the S3 event
+            body = json.loads(body['Message'])
+
+        # Safety check: ensure this is actually an S3 event
+        if 'Records' not in body:
+            print(f"⚠️  Skipping unrecognised message format: {list(body.keys())}")
+            delete_entries.append({'Id': msg['MessageId'], 'ReceiptHandle': msg['ReceiptHandle']})
+            continue
+
+        bucket = body['Records'][0]['s3']['bucket']['name']
+        key    = body['Records'][0]['s3']['object']['key']
+        print(f"📥 Queued for processing: s3://{bucket}/{key}")
+        jobs.append({
+            'msg_id':  msg['MessageId'],
+            'receipt': msg['ReceiptHandle'],
+            'bucket':  bucket,
+            'key':     key,
+        })
+
+    # 3. Stream all images from S3 into memory concurrently (S3 streams don't
+    # contend, so parallel downloads hide the per-object latency). No /tmp
+    # round-trip - the bytes go straight to the classifier.
+    def fetch_image(job):
+        buf = io.BytesIO()
+        s3.download_fileobj(job['bucket'], job['key'], buf, Config=S3_TRANSFER_CONFIG)
+        job['data'] = buf.getvalue()
+
+    downloaded = []
+    if jobs:
+        print(f"   Fetching {len(jobs)} image(s) from S3...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as pool:
+            futures = {pool.submit(fetch_image, job): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    downloaded.append(job)
+                except Exception as e:
+                    # Leave the message in the queue - it becomes visible again
+                    # after the visibility timeout and gets retried.
+                    print(f"❌ Download failed for {job['key']}: {e}")
+
+    return downloaded, delete_entries
+
+
+def process_batch(downloaded, delete_entries):
+    """Run batched ML inference on fetched images, store results, notify via SNS."""
+
+    if not downloaded:
+        if delete_entries:
+            sqs.delete_message_batch(QueueUrl=QUEUE_URL, Entries=delete_entries)
         return
 
-    msg  = response['Messages'][0]
-    body = json.loads(msg['Body'])
-
-    # SQS sometimes wraps the S3 event in an SNS envelope - handle both formats
-    if 'Message' in body:
-        # SNS-wrapped format: body['Message'] is a JSON string containing the S3 event
-        body = json.loads(body['Message'])
-
-    # Safety check: ensure this is actually an S3 event
-    if 'Records' not in body:
-        print(f"⚠️  Skipping unrecognised message format: {list(body.keys())}")
-        sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=msg['ReceiptHandle'])
-        return
-
-    bucket   = body['Records'][0]['s3']['bucket']['name']
-    key      = body['Records'][0]['s3']['object']['key']
-    print(f"📥 Processing: s3://{bucket}/{key}")
+    # 4. ML Inference - one batched forward pass over all downloaded images
+    print(f"   Running ML inference on batch of {len(downloaded)}...")
+    results = classifier.predict_batch([job['data'] for job in downloaded])
+
+    # 5. Build the DynamoDB items and SNS notifications for every result
+    items         = []
+    notifications = []
+    for job, (species_en, data, confidence) in zip(downloaded, results):
+        key = job['key']
+        print(f"   Identified: {species_en} ({data['name']}) — confidence: {confidence:.1%}")
+
+        # The 'ImageId' (S3 key) is the primary key - the webapp polls on this
+        items.append({
+            'ImageId':      key,
+            'Species':      species_en,
+            'HebrewName':   data['name'],
+            'NativeStatus': data['native_status'],
+            'Population':   data['population_status'],
+            'AvgSizeCM':    data['avg_size_cm'],
+            'MinSizeCM':    data['regulations']['min_size_cm'],
+            'SeasonalBan':  data['regulations']['seasonal_ban'],
+            'Notes':        data['regulations']['notes'],
+            'Description':  data['description'],
+            # Track model confidence so low-scoring results can be reviewed for retraining
+            'Confidence':   str(round(confidence, 4)),
+            'NeedsReview':  confidence < 0.70,  # Flag uncertain predictions for dataset improvement
+        })
+
+        # Hebrew-formatted message for SMS/email subscribers. The body is
+        # precomputed per species in fish_dictionary - only the confidence is
+        # substituted here. The classifier's "Error" placeholder has no
+        # template, so that path still builds the message inline.
+        conf_str = f"{confidence:.0%}"
+        if species_en in SNS_TEMPLATE:
+            message_text = SNS_TEMPLATE[species_en] % conf_str
+            subject      = SNS_SUBJECT[species_en]
+        else:
+            ban_status   = "פעיל" if data['regulations']['seasonal_ban'] else "לא פעיל"
+            message_text = (
+                f"זיהוי: {data['name']} ({species_en}) - ביטחון: {conf_str}\n"
+                f"סטטוס: {data['native_status']} | {data['population_status']}\n"
+                f"גודל מינימלי: {data['regulations']['min_size_cm']} ס״מ\n"
+                f"איסור עונתי: {ban_status}\n"
+                f"הערות: {data['regulations']['notes']}"
+            )
+            subject = f"תוצאה: {data['name']}"
+
+        notifications.append({
+            'Id':      str(len(notifications)),  # Unique within the batch request
+            'Message': message_text,
+            'Subject': subject,
+        })
+
+        delete_entries.append({'Id': job['msg_id'], 'ReceiptHandle': job['receipt']})
+        print(f"✅ Done: {key} → {species_en}")
+
+    # 6. Save all results in one batched DynamoDB write
+    # batch_writer chunks to the 25-item BatchWriteItem limit and retries
+    # UnprocessedItems with backoff for us. overwrite_by_pkeys dedups repeat
+    # ImageIds within the batch (SQS at-least-once can deliver the same key
+    # twice in one receive) - without it BatchWriteItem rejects the request.
+    print(f"   Saving {len(items)} result(s) to DynamoDB...")
+    table = dynamodb.Table(TABLE_NAME)
+    with table.batch_writer(overwrite_by_pkeys=['ImageId']) as writer:
+        for item in items:
+            writer.put_item(Item=item)
 
-    # 2. Download image from S3 to /tmp (ephemeral scratch space)
-    tmp_path = f"/tmp/{os.path.basename(key)}"
-    print(f"   Downloading to {tmp_path}...")
-    s3.download_file(bucket, key, tmp_path)
+    # 7. Publish all notifications via SNS PublishBatch (max 10 per call)
+    print(f"   Sending {len(notifications)} SNS notification(s)...")
+    for i in range(0, len(notifications), 10):
+        sns.publish_batch(
+            TopicArn=SNS_ARN,
+            PublishBatchRequestEntries=notifications[i:i + 10]
+        )
 
-    # 3. ML Inference
-    print("   Running ML inference...")
-    species_en, data, confidence = classifier.predict(tmp_path)
-    print(f"   Identified: {species_en} ({data['name']}) — confidence: {confidence:.1%}")
+    # 8. Delete all processed messages from the queue in one API call
+    if delete_entries:
+        sqs.delete_message_batch(QueueUrl=QUEUE_URL, Entries=delete_entries)
 
-    # 4. Save structured result to DynamoDB
-    # The 'ImageId' (S3 key) is the primary key - the webapp polls on this
-    print("   Saving result to DynamoDB...")
-    table = dynamodb.Table(TABLE_NAME)
-    table.put_item(Item={
-        'ImageId':      key,
-        'Species':      species_en,
-        'HebrewName':   data['name'],
-        'NativeStatus': data['native_status'],
-        'Population':   data['population_status'],
-        'AvgSizeCM':    data['avg_size_cm'],
-        'MinSizeCM':    data['regulations']['min_size_cm'],
-        'SeasonalBan':  data['regulations']['seasonal_ban'],
-        'Notes':        data['regulations']['notes'],
-        'Description':  data['description'],
-        # Track model confidence so low-scoring results can be reviewed for retraining
-        'Confidence':   str(round(confidence, 4)),
-        'NeedsReview':  confidence < 0.70,  # Flag uncertain predictions for dataset improvement
-    })
-
-    # 5. Notify via SNS (Hebrew-formatted message for SMS/email subscribers)
-    ban_status   = "פעיל" if data['regulations']['seasonal_ban'] else "לא פעיל"
-    message_text = (
-        f"🐟 זיהוי: {data['name']} ({species_en})\n"
-        f"סטטוס: {data['native_status']} | {data['population_status']}\n"
-        f"גודל מינימלי: {data['regulations']['min_size_cm']} ס״מ\n"
-        f"איסור עונתי: {ban_status}\n"
-        f"הערות: {data['regulations']['notes']}"
-    )
-    print("   Sending SNS notification...")
-    sns.publish(
-        TopicArn=SNS_ARN,
-        Message=message_text,
-        Subject=f"תוצאה: {data['name']}"
-    )
 
-    # 6. Delete processed message from queue
-    sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=msg['ReceiptHandle'])
-    print(f"✅ Done: {key} → {species_en}")
+def process_fish():
+    """Run one poll-fetch-infer-publish cycle (single-shot, no pipelining)."""
+    downloaded, delete_entries = poll_and_fetch()
+    process_batch(downloaded, delete_entries)
 
 
 if __name__ == "__main__":
     print("\n🔄 Entering polling loop. Press Ctrl+C to stop.\n")
-    while True:
-        try:
-            process_fish()
-        except KeyboardInterrupt:
-            print("\n👋 Worker stopped by user.")
-            break
-        except Exception as e:
-            # Log the error but keep the loop running - the message will
-            # become visible again in SQS after the visibility timeout expires.
-            print(f"❌ Error during processing: {e}")
+
+    # Pipelined loop: while batch N runs inference and publishes its results,
+    # the prefetcher thread is already long-polling SQS and downloading batch
+    # N+1's images. The CPU no longer sits idle during the network waits.
+    prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    next_batch = prefetcher.submit(poll_and_fetch)
+    try:
+        while True:
+            try:
+                downloaded, delete_entries = next_batch.result()
+            except Exception as e:
+                print(f"❌ Error during polling: {e}")
+                next_batch = prefetcher.submit(poll_and_fetch)
+                continue
+
+            # Kick off the next poll before processing this batch
+            next_batch = prefetcher.submit(poll_and_fetch)
+
+            try:
+                process_batch(downloaded, delete_entries)
+            except Exception as e:
+                # Log the error but keep the loop running - the messages will
+                # become visible again in SQS after the visibility timeout expires.
+                print(f"❌ Error during processing: {e}")
+    except KeyboardInterrupt:
+        print("\n👋 Worker stopped by user.")
+    finally:
+        prefetcher.shutdown(wait=False, cancel_futures=True)
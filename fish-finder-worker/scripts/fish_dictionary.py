@@ -260,3 +260,45 @@ FISH_DATA = {
         "description": "צייד מהיר האורב לטרפו בלהקות או כבודד."
     }
 }
+
+
+# ---------------------------------------------------------------------------
+# Precomputed lookups (built once at import time, shared by the workers)
+# ---------------------------------------------------------------------------
+# The model's class indices are assigned alphabetically (torchvision
+# ImageFolder ordering), so index i of these tuples corresponds to class i.
+# Freezing them here removes the sorted() call from every cold start and the
+# dict hashing from the per-request path.
+SPECIES_LIST = tuple(sorted(FISH_DATA.keys()))
+FISH_RECORDS = tuple(FISH_DATA[species] for species in SPECIES_LIST)
+
+# Display string for the minimum catch size, precomputed so the per-request
+# path has no string formatting and no None-check branch.
+MIN_SIZE_DISPLAY = {
+    species: (
+        "אין גודל מינימלי"
+        if FISH_DATA[species]["regulations"]["min_size_cm"] is None
+        else f'{FISH_DATA[species]["regulations"]["min_size_cm"]} ס״מ'
+    )
+    for species in SPECIES_LIST
+}
+
+# SNS notification text, precomputed per species. Everything in the message is
+# a function of the species except the confidence score, so the whole body is
+# assembled once at import time with a single %s placeholder left for the
+# confidence - the per-request path does one % substitution instead of
+# walking the nested dicts and re-concatenating the constant Hebrew labels.
+SNS_SUBJECT = {
+    species: f"תוצאה: {FISH_DATA[species]['name']}" for species in SPECIES_LIST
+}
+
+SNS_TEMPLATE = {
+    species: (
+        f"זיהוי: {FISH_DATA[species]['name']} ({species}) - ביטחון: %s\n"
+        f"סטטוס: {FISH_DATA[species]['native_status']} | {FISH_DATA[species]['population_status']}\n"
+        f"גודל מינימלי: {MIN_SIZE_DISPLAY[species]}\n"
+        f"איסור עונתי: {'פעיל' if FISH_DATA[species]['regulations']['seasonal_ban'] else 'לא פעיל'}\n"
+        f"הערות: {FISH_DATA[species]['regulations']['notes']}"
+    )
+    for species in SPECIES_LIST
+}
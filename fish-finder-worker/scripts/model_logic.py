@@ -1,14 +1,58 @@
 import os
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
-from PIL import Image
-from pathlib import Path
-from fish_dictionary import FISH_DATA
+
+
+def _usable_cpu_count():
+    """
+    Number of vCPUs torch should use on this deployment.
+
+    On Lambda, os.cpu_count() reports the host's cores, not the function's
+    share - the vCPU allocation scales with the memory tier (~1 vCPU per
+    1769MB). Sizing threads off the host count oversubscribes the tiny
+    functions and makes latency worse, so derive it from the memory size.
+    """
+    memory_mb = os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    if memory_mb:
+        return max(1, int(memory_mb) // 1769)
+    return os.cpu_count() or 1
+
+
+_NUM_THREADS = _usable_cpu_count()
+
+# These must be set before torch spawns its thread pools (i.e. before import)
+os.environ.setdefault('OMP_NUM_THREADS', str(_NUM_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(_NUM_THREADS))
+
+import cv2                        # noqa: E402 (imports must follow the env setup above)
+import numpy as np                # noqa: E402
+import torch                      # noqa: E402
+from pathlib import Path          # noqa: E402
+from fish_dictionary import SPECIES_LIST, FISH_RECORDS  # noqa: E402
 
 # Redirect Torch home to /tmp in case any utility tries to write to a home dir
 os.environ['TORCH_HOME'] = '/tmp/.torch'
 
+# Pin torch to the vCPUs we actually have and keep inter-op parallelism at 1 -
+# a single worker/Lambda invocation runs one forward pass at a time, so extra
+# inter-op threads only add contention. oneDNN (MKLDNN) speeds up the convs.
+torch.set_num_threads(_NUM_THREADS)
+torch.set_num_interop_threads(1)
+torch.backends.mkldnn.enabled = True
+
+# ImageNet normalisation constants (match the training transforms)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD  = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# The whole normalisation - scale to [0,1], subtract mean, divide by std -
+# collapses into one fused multiply-add: y = x * scale + bias, with the /255
+# and the reciprocal std folded into the constants. Three per-channel divides
+# become multiplies, applied in-place in a single vectorised pass.
+NORM_SCALE = (1.0 / (255.0 * IMAGENET_STD))
+NORM_BIAS  = (-IMAGENET_MEAN / IMAGENET_STD)
+
+# Largest batch the workers feed in one forward pass (SQS caps a receive at
+# 10 messages, which is also the Lambda trigger's batch_size in lambda.tf)
+MAX_BATCH_SIZE = 10
+
 class FishClassifier:
     def __init__(self):
         # 1. Setup Paths
@@ -21,44 +65,149 @@ class FishClassifier:
         else:
             self.model_dir = current_dir.parent / "models"
 
-        self.model_path = self.model_dir / "israel_med_fish_v1.pth"
+        self.model_path  = self.model_dir / "israel_med_fish_v3small_v1.pth"
+        self.traced_path = self.model_dir / "israel_med_fish_v3small_v1.ts"
 
         # REMOVED: self.model_dir.mkdir(exist_ok=True)
         # This causes Errno 30 on Lambda because /var/task is read-only.
 
-        # 2. Define Architecture (MobileNetV2)
-        print("--- Initializing MobileNetV2 Architecture ---")
-        # weights=None prevents the model from trying to download anything during init
-        self.model = models.mobilenet_v2(weights=None)
+        if self.traced_path.exists():
+            # Fast path: a pre-traced TorchScript module bundled in the image.
+            # Loading it skips the architecture build, state_dict load and
+            # tracing below entirely, which shaves cold-start init time.
+            print(f"--- Loading traced TorchScript model from: {self.traced_path} ---")
+            self.model = torch.jit.load(str(self.traced_path))
+        else:
+            # torchvision (and its full model-zoo registry) is only needed to
+            # rebuild the architecture, so import it lazily here - the traced
+            # fast path above never pays that import cost at cold start.
+            import torch.nn as nn
+            from torchvision import models
+
+            # 2. Define Architecture (MobileNetV3-Small)
+            # ~2.5M params / ~60 MFLOPs vs MobileNetV2's ~3.5M / ~300 MFLOPs:
+            # similar accuracy on our 20 classes at a fraction of the CPU cost,
+            # and a smaller weights file in the container layer.
+            print("--- Initializing MobileNetV3-Small Architecture ---")
+            # weights=None prevents the model from trying to download anything during init
+            self.model = models.mobilenet_v3_small(weights=None)
+
+            # 3. Modify the 'Head' (Output Layer) for our 20 species
+            # (classifier[3] is the final Linear layer on v3-small)
+            num_ftrs = self.model.classifier[3].in_features
+            self.model.classifier[3] = nn.Linear(num_ftrs, len(SPECIES_LIST))
+
+            # 4. Load Custom Weights if they exist
+            if self.model_path.exists():
+                print(f"--- Loading custom trained weights from: {self.model_path} ---")
+                # mmap avoids reading the whole .pth into fresh memory at cold
+                # start: the weights are paged in from the image layer on
+                # demand, and the OS page cache shares them across warm
+                # invocations. assign=True adopts the mapped tensors directly
+                # instead of copying them into the module's parameters.
+                state_dict = torch.load(self.model_path, map_location='cpu', mmap=True, weights_only=True)
+                self.model.load_state_dict(state_dict, assign=True)
+            else:
+                print(f"--- WARNING: No trained model found at {self.model_path} ---")
+                # REMOVED: torch.save(self.model.state_dict(), self.model_path)
+                # Never attempt to save weights to the read-only /var/task/models directory.
+
+            self.model.eval()
+
+            # 5. Quantise weights to int8 for CPU inference
+            # Lambda/EC2 have no GPU, so fp32 inference leaves throughput on the table.
+            # Dynamic quantisation converts the Linear layers to int8 (the quant/dequant
+            # happens at layer boundaries, so inputs stay fp32 and predict() is unchanged).
+            # Conv layers would need static quantisation with a calibration pass - a
+            # larger change that requires re-exporting the weights.
+            if 'fbgemm' in torch.backends.quantized.supported_engines:
+                # FBGEMM is the x86 int8 backend (Lambda and our EC2 workers are x86)
+                torch.backends.quantized.engine = 'fbgemm'
+            print("--- Quantising model to int8 (dynamic, Linear layers) ---")
+            self.model = torch.quantization.quantize_dynamic(self.model, {nn.Linear}, dtype=torch.qint8)
+
+            # 6. Trace + freeze the inference graph
+            # Eager nn.Module execution pays Python dispatch per layer per call.
+            # Tracing removes the Python frames from the hot path and freezing
+            # folds constants / fuses conv+bn, a clear win for CPU inference.
+            # Tracing generalises over the batch dimension, so predict_batch
+            # can still feed (N,3,224,224) inputs.
+            print("--- Tracing and freezing inference graph ---")
+            example = torch.randn(1, 3, 224, 224)
+            self.model = torch.jit.freeze(torch.jit.trace(self.model, example))
+
+        # Keep a handle to the frozen (pre-optimize) module for export_traced:
+        # optimize_for_inference rewrites the conv weights into MKLDNN-layout
+        # constants, which torch.jit.save cannot serialize - the optimized
+        # module is for immediate inference only.
+        self._frozen_model = self.model
+        self.model = torch.jit.optimize_for_inference(self.model)
+
+        # Precomputed in fish_dictionary at import time - no sorting per cold start
+        self.species_list = SPECIES_LIST
+
+        # Preallocated input buffer, reused across invocations: predict_batch
+        # copies each preprocessed image into a slice of this tensor instead of
+        # allocating a fresh (N,3,224,224) batch (~600KB/image) per request.
+        self._input_buf = torch.empty(MAX_BATCH_SIZE, 3, 224, 224, dtype=torch.float32)
 
-        # 3. Modify the 'Head' (Output Layer) for our 20 species
-        num_ftrs = self.model.classifier[1].in_features
-        self.model.classifier[1] = nn.Linear(num_ftrs, len(FISH_DATA))
+    def export_traced(self, out_path=None):
+        """Save the traced/frozen module so future cold starts can torch.jit.load it."""
+        out_path = out_path or self.traced_path
+        # Save the frozen module, not self.model: after optimize_for_inference
+        # the weights are MKLDNN tensors that torch.jit.save rejects.
+        torch.jit.save(self._frozen_model, str(out_path))
+        print(f"--- Traced model saved to: {out_path} ---")
+        return out_path
 
-        # 4. Load Custom Weights if they exist
-        if self.model_path.exists():
-            print(f"--- Loading custom trained weights from: {self.model_path} ---")
-            state_dict = torch.load(self.model_path, map_location='cpu')
-            self.model.load_state_dict(state_dict)
+    def _preprocess(self, image_src):
+        """
+        Decode, resize, centre-crop and normalise one image in a single fused pass.
+
+        image_src is either a filesystem path or the raw encoded image bytes
+        (e.g. an S3 object body streamed straight into memory).
+
+        Replaces the old Resize/CenterCrop/ToTensor/Normalize torchvision chain,
+        which allocated a fresh PIL image or tensor per step. OpenCV's SIMD
+        decode/resize plus one vectorised NumPy normalise keeps preprocessing
+        from rivalling the forward pass on small CPUs.
+
+        Returns a (3, 224, 224) float32 tensor.
+        """
+        if isinstance(image_src, (bytes, bytearray, memoryview)):
+            img = cv2.imdecode(np.frombuffer(image_src, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("Could not decode in-memory image bytes")
         else:
-            print(f"--- WARNING: No trained model found at {self.model_path} ---")
-            # REMOVED: torch.save(self.model.state_dict(), self.model_path)
-            # Never attempt to save weights to the read-only /var/task/models directory.
+            img = cv2.imread(str(image_src), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f"Could not decode image: {image_src}")
 
-        self.model.eval()
+        # Resize so the short side is 256, preserving aspect ratio
+        h, w  = img.shape[:2]
+        scale = 256.0 / min(h, w)
+        new_w, new_h = int(round(w * scale)), int(round(h * scale))
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
 
-        self.transform = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-        ])
+        # Centre-crop to 224x224 (a view - no copy)
+        y0 = (new_h - 224) // 2
+        x0 = (new_w - 224) // 2
+        img = img[y0:y0 + 224, x0:x0 + 224]
 
-        self.species_list = sorted(FISH_DATA.keys())
+        # OpenCV decodes BGR; the model was trained on RGB
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-    def predict(self, image_path):
+        # Normalise in-place with the precomputed scale/bias (one fused
+        # multiply-add over the whole array), then HWC -> CHW
+        arr = img.astype(np.float32)
+        arr *= NORM_SCALE
+        arr += NORM_BIAS
+        arr = np.ascontiguousarray(arr.transpose(2, 0, 1))
+        return torch.from_numpy(arr)
+
+    def predict(self, image_src):
         """
-        Run inference on a fish image.
+        Run inference on a fish image (a file path or raw encoded bytes).
 
         Returns:
             species_key (str): Latin species name (e.g. "Sparus aurata")
@@ -66,37 +215,78 @@ class FishClassifier:
             confidence  (float): Softmax probability of the top prediction (0.0 - 1.0)
                                  Values below ~0.70 are worth flagging for manual review.
         """
-        try:
-            img = Image.open(image_path).convert('RGB')
-            img_t = self.transform(img).unsqueeze(0)  # Add batch dimension
+        return self.predict_batch([image_src])[0]
+
+    def predict_batch(self, image_srcs):
+        """
+        Run inference on several fish images in a single forward pass.
+
+        Each entry of image_srcs is a file path or raw encoded bytes.
+
+        CPU inference is dominated by fixed per-call overhead, so stacking the
+        images into one (N,3,224,224) batch amortises it across the whole batch.
+
+        Returns:
+            A list of (species_key, fish_info, confidence) tuples in the same
+            order as image_srcs. Images that fail to load get the same error
+            entry that predict() returns, without failing the rest of the batch.
+        """
+        results = [None] * len(image_srcs)
+        tensors = []
+        loaded  = []  # index into image_srcs for each entry in tensors
+
+        for i, image_src in enumerate(image_srcs):
+            try:
+                tensors.append(self._preprocess(image_src))
+                loaded.append(i)
+            except Exception as e:
+                print(f"--- Prediction ERROR: {e} ---")
+                results[i] = self._error_result(e)
+
+        if tensors:
+            if len(tensors) <= MAX_BATCH_SIZE:
+                # Copy into the preallocated buffer - no per-call batch allocation
+                batch = self._input_buf[:len(tensors)]
+                for pos, tensor in enumerate(tensors):
+                    batch[pos].copy_(tensor)
+            else:
+                # Oversized ad-hoc batches (not the SQS path) get a fresh allocation
+                batch = torch.stack(tensors)  # Shape: (N, 3, 224, 224)
 
             with torch.no_grad():
-                outputs = self.model(img_t)
-
-                # Convert raw logits to probabilities so we get a meaningful confidence score
-                probabilities = torch.nn.functional.softmax(outputs, dim=1)
-                confidence, predicted_idx = torch.max(probabilities, 1)
-
-            idx         = predicted_idx.item()
-            species_key = self.species_list[idx]
-            fish_info   = FISH_DATA[species_key]
-            conf_value  = confidence.item()
-
-            print(f"--- Prediction: {species_key} | Confidence: {conf_value:.1%} ---")
-            return species_key, fish_info, conf_value
-
-        except Exception as e:
-            print(f"--- Prediction ERROR: {e} ---")
-            return "Error", {
-                "name": "שגיאה בזיהוי",
-                "native_status": "Unknown",
-                "population_status": "Unknown",
-                "avg_size_cm": 0,
-                "regulations": {"min_size_cm": 0, "seasonal_ban": False, "notes": str(e)},
-                "description": str(e),
-            }, 0.0
+                logits = self.model(batch)
+
+                # Top-1 on raw logits (softmax is monotonic, so argmax is the
+                # same), then recover just the top probability with one
+                # logsumexp per row - no full (N, classes) softmax tensor is
+                # materialised for a score we only report for the winner.
+                predicted_idxs = logits.argmax(dim=1)
+                top_logits     = logits.gather(1, predicted_idxs.unsqueeze(1)).squeeze(1)
+                confidences    = torch.exp(top_logits - torch.logsumexp(logits, dim=1))
+
+            for pos, i in enumerate(loaded):
+                idx         = predicted_idxs[pos].item()
+                species_key = SPECIES_LIST[idx]
+                conf_value  = confidences[pos].item()
+
+                print(f"--- Prediction: {species_key} | Confidence: {conf_value:.1%} ---")
+                results[i] = (species_key, FISH_RECORDS[idx], conf_value)
+
+        return results
+
+    @staticmethod
+    def _error_result(e):
+        """Placeholder result returned when an image cannot be classified."""
+        return "Error", {
+            "name": "שגיאה בזיהוי",
+            "native_status": "Unknown",
+            "population_status": "Unknown",
+            "avg_size_cm": 0,
+            "regulations": {"min_size_cm": 0, "seasonal_ban": False, "notes": str(e)},
+            "description": str(e),
+        }, 0.0
 
 # For quick local testing
 if __name__ == "__main__":
     clf = FishClassifier()
-    print(f"Model ready for {len(FISH_DATA)} species.")
+    print(f"Model ready for {len(SPECIES_LIST)} species.")
@@ -1,89 +1,336 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.utils.checkpoint import checkpoint_sequential
 from torchvision import models, transforms, datasets
+from torchvision.transforms import v2
+import sys
+import threading
 import time
 import zipfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 1. SETUP & CONFIGURATION ---
 DATA_ZIP = "dataset.zip"
 EXTRACT_PATH = "./fish_data"
-MODEL_SAVE_NAME = "israel_med_fish_v1.pth"
-BATCH_SIZE = 32
+MODEL_SAVE_NAME = "israel_med_fish_v3small_v1.pth"
+BATCH_SIZE = 64  # Micro-batch per step - see ACCUM_STEPS below
 EPOCHS = 20  # Increased limit, but Early Stopping will likely catch it sooner
 TARGET_ACCURACY = 0.95  # The script will stop once we hit 95% accuracy
+AUG_COPIES = 4  # Augmented embedding copies cached per image (the aug budget)
+HEAD_BATCH_SIZE = 1024  # Cached embeddings are tiny - big batches keep the GPU busy
+
+# Fine-tune the whole network instead of just the head. Activation memory for
+# the full backbone backward is the batch-size cap, so the backbone forward is
+# run through checkpoint_sequential (activations recomputed in backward,
+# ~1/sqrt(n) of the memory for ~20% extra compute).
+#   python train_module.py --unfreeze-backbone
+UNFREEZE_BACKBONE = "--unfreeze-backbone" in sys.argv
+
+# End-to-end fine-tuning accumulates gradients over this many micro-batches
+# before each optimizer step: effective batch = BATCH_SIZE * ACCUM_STEPS = 256,
+# which amortises the fixed per-step cost (launches, optimizer) over more
+# samples without needing the memory for a real 256 batch. The head path
+# already trains at HEAD_BATCH_SIZE, so it steps every micro-batch.
+ACCUM_STEPS = 4
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"✅ Training on: {device}")
 
+# Let cuDNN benchmark conv algorithms - input shapes are fixed at 224x224,
+# so the one-off autotune pays for itself within the first epoch.
+torch.backends.cudnn.benchmark = True
+
+# Mixed precision: convs run as FP16 Tensor Core kernels while reductions
+# stay FP32. Only meaningful (and only enabled) on CUDA.
+USE_AMP = device.type == "cuda"
+
 # --- 2. EXTRACT DATA ---
+# Threaded extraction: zlib.decompress releases the GIL, so decoding scales
+# to ~min(cores, 8). A shared ZipFile handle is NOT thread-safe (workers
+# would seek under each other), so each worker thread opens its own.
 if not os.path.exists(EXTRACT_PATH):
     print("📂 Unzipping dataset...")
     with zipfile.ZipFile(DATA_ZIP, 'r') as zip_ref:
-        zip_ref.extractall(EXTRACT_PATH)
+        members = zip_ref.namelist()
+
+    _local = threading.local()
+
+    def extract_member(name):
+        if not hasattr(_local, "zf"):
+            _local.zf = zipfile.ZipFile(DATA_ZIP, 'r')
+        _local.zf.extract(name, EXTRACT_PATH)
+
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+        list(pool.map(extract_member, members))
     print("✅ Extraction Complete!")
 
-# Logic to find the folder containing species subfolders
-data_dir = EXTRACT_PATH
-for root, dirs, files in os.walk(EXTRACT_PATH):
-    if len(dirs) > 1:
-        data_dir = root
-        break
+# Logic to find the folder containing species subfolders. The walk stats
+# every file in each visited directory, which takes seconds on a large
+# dataset with a cold FS cache - so the resolved path is written next to the
+# extracted data and reused on subsequent runs. (Delete fish_data/ to reset.)
+DATA_DIR_CACHE = os.path.join(EXTRACT_PATH, ".data_dir")
+if os.path.exists(DATA_DIR_CACHE):
+    with open(DATA_DIR_CACHE) as f:
+        data_dir = f.read().strip()
+else:
+    data_dir = EXTRACT_PATH
+    for root, dirs, files in os.walk(EXTRACT_PATH):
+        if len(dirs) > 1:
+            data_dir = root
+            break
+    with open(DATA_DIR_CACHE, "w") as f:
+        f.write(data_dir)
 print(f"🎯 Data directory set to: {data_dir}")
 
 # --- 3. PREPARE IMAGES ---
+# CPU workers only decode + resize + convert to uint8 tensors. The heavy
+# geometric/colour augmentation moved to the GPU (see gpu_augment below):
+# per-image PIL rotation and jitter in Python was the dataloader bottleneck,
+# and shipping uint8 instead of float32 also quarters the H2D copy size.
 data_transforms = transforms.Compose([
     transforms.Resize((224, 224)),
-    transforms.RandomHorizontalFlip(),
-    transforms.RandomRotation(15),
-    transforms.ColorJitter(brightness=0.2, contrast=0.2),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    transforms.PILToTensor(),
+])
+
+# Batched GPU augmentation via transforms.v2 - one vectorised warp per batch
+# instead of per-image PIL ops. Note v2 samples one set of random parameters
+# per call, so all images in a batch share the same flip/rotation/jitter;
+# with shuffled batches and AUG_COPIES passes the effective variety is fine.
+gpu_augment = v2.Compose([
+    v2.RandomHorizontalFlip(),
+    v2.RandomRotation(15),
+    v2.ColorJitter(brightness=0.2, contrast=0.2),
+    v2.ToDtype(torch.float32, scale=True),
+    v2.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
 ])
 
 image_dataset = datasets.ImageFolder(data_dir, data_transforms)
-dataloader = torch.utils.data.DataLoader(image_dataset, batch_size=BATCH_SIZE, shuffle=True)
+
+# Parallel data loading: with num_workers=0 the PIL decode + resize ran
+# serially on the main thread and the GPU starved between batches. Worker
+# processes decode ahead (prefetch_factor batches each), pinned memory makes
+# the H2D copies async, and persistent workers skip the per-epoch fork cost.
+# drop_last keeps every batch the same shape (cuDNN benchmark + AMP friendly).
+NUM_WORKERS = min(8, os.cpu_count() or 1)
+dataloader = torch.utils.data.DataLoader(
+    image_dataset,
+    batch_size=BATCH_SIZE,
+    shuffle=True,
+    num_workers=NUM_WORKERS,
+    pin_memory=True,
+    persistent_workers=NUM_WORKERS > 0,
+    prefetch_factor=4 if NUM_WORKERS > 0 else None,
+    drop_last=True,
+)
 class_names = image_dataset.classes
 print(f"🐟 Found {len(class_names)} species.")
 
+# --- 3b. OPTIONAL: DALI PIPELINE ---
+# When NVIDIA DALI is installed (GPU sessions only), JPEG decode moves to the
+# GPU via nvJPEG and resize/flip/rotate/jitter/normalise all run as batched
+# GPU ops - the CPU workers stop being the bottleneck entirely. Without DALI
+# the torchvision dataloader above is used unchanged.
+HAS_DALI = False
+if device.type == "cuda":
+    try:
+        from nvidia.dali import fn, types
+        from nvidia.dali.pipeline import pipeline_def
+        from nvidia.dali.plugin.pytorch import DALIGenericIterator, LastBatchPolicy
+
+        HAS_DALI = True
+    except ImportError:
+        print("ℹ️ NVIDIA DALI not installed - using the torchvision dataloader.")
+
+if HAS_DALI:
+    # fn.readers.file labels subfolders in sorted order - the same ordering
+    # ImageFolder uses, so class indices stay consistent with class_names.
+    @pipeline_def(batch_size=BATCH_SIZE, num_threads=NUM_WORKERS, device_id=0)
+    def fish_pipeline():
+        jpegs, labels = fn.readers.file(
+            file_root=data_dir, random_shuffle=True, name="reader"
+        )
+        images = fn.decoders.image(jpegs, device="mixed")  # nvJPEG decode on GPU
+        images = fn.resize(images, size=[224, 224])
+        images = fn.rotate(
+            images,
+            angle=fn.random.uniform(range=[-15.0, 15.0]),
+            keep_size=True,
+            fill_value=0,
+        )
+        images = fn.color_twist(
+            images,
+            brightness=fn.random.uniform(range=[0.8, 1.2]),
+            contrast=fn.random.uniform(range=[0.8, 1.2]),
+        )
+        # Fuses mirror + normalise + HWC->CHW; DALI normalises in 0-255 space
+        images = fn.crop_mirror_normalize(
+            images,
+            dtype=types.FLOAT16,
+            output_layout="CHW",
+            mirror=fn.random.coin_flip(),
+            mean=[0.485 * 255, 0.456 * 255, 0.406 * 255],
+            std=[0.229 * 255, 0.224 * 255, 0.225 * 255],
+        )
+        return images, labels
+
+    dali_iter = DALIGenericIterator(
+        fish_pipeline(),
+        ["images", "labels"],
+        reader_name="reader",
+        last_batch_policy=LastBatchPolicy.DROP,
+        auto_reset=True,
+    )
+    print("⚡ DALI pipeline active - JPEG decode and augmentation on GPU.")
+
 # --- 4. BUILD MODEL ---
-model = models.mobilenet_v2(weights="IMAGENET1K_V1")
-for param in model.features.parameters():
-    param.requires_grad = False
+# MobileNetV3-Small: ~3-5x less compute than MobileNetV2 for similar accuracy
+# on our 20 classes - matches the architecture model_logic.py deploys.
+model = models.mobilenet_v3_small(weights="IMAGENET1K_V1")
+if not UNFREEZE_BACKBONE:
+    for param in model.features.parameters():
+        param.requires_grad = False
+
+# classifier[3] is the final Linear layer on v3-small
+num_ftrs = model.classifier[3].in_features
+model.classifier[3] = nn.Linear(num_ftrs, len(class_names))
+# channels_last (NHWC) is the layout Tensor Core conv kernels want - halves
+# activation bandwidth vs the default NCHW on Ampere+ GPUs
+model = model.to(device, memory_format=torch.channels_last)
+
+# --- 5. CACHE FROZEN-BACKBONE EMBEDDINGS ---
+# (skipped with --unfreeze-backbone: a trainable backbone changes every epoch,
+# so its outputs cannot be cached and training runs end-to-end on images)
+if not UNFREEZE_BACKBONE:
+    # The backbone is frozen, so re-running it on the same images every epoch
+    # is pure wasted compute. Run it AUG_COPIES times over the augmented
+    # dataset once up front (a fixed augmentation budget), cache the pooled
+    # embeddings as float16, and train the classifier head on the cached
+    # tensors: the backbone cost is paid AUG_COPIES times instead of EPOCHS
+    # times, and image decode / augmentation leave the training loop entirely.
+    # Keep the backbone in eval mode: train() would update the BatchNorm
+    # running stats even with requires_grad off, drifting ImageNet statistics.
+    model.features.eval()
 
-num_ftrs = model.classifier[1].in_features
-model.classifier[1] = nn.Linear(num_ftrs, len(class_names))
-model = model.to(device)
+    # Compile the backbone forward: Inductor fuses conv+BN+activation chains
+    # into single kernels and "reduce-overhead" replays them via CUDA graphs,
+    # removing the per-op launch overhead that dominates small-batch MobileNet
+    # runtime. Compile into a local handle (not back onto model.features) so
+    # the saved state_dict keys keep their original names, and warm up on one
+    # dummy batch so graph capture happens before the timed caching pass.
+    # drop_last=True keeps every batch the same shape, so nothing re-traces.
+    backbone = model.features
+    if device.type == "cuda":
+        backbone = torch.compile(model.features, mode="reduce-overhead")
+        with torch.no_grad():
+            warmup = torch.zeros(
+                BATCH_SIZE, 3, 224, 224, device=device
+            ).to(memory_format=torch.channels_last)
+            with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=USE_AMP):
+                backbone(warmup)
 
-# --- 5. TRAIN WITH EARLY STOPPING ---
+    print(f"\n🧊 Caching backbone embeddings ({AUG_COPIES} augmented copies per image)...")
+    cache_start = time.time()
+    feature_chunks = []
+    label_chunks = []
+    with torch.no_grad():
+        for copy in range(AUG_COPIES):
+            for batch in (dali_iter if HAS_DALI else dataloader):
+                if HAS_DALI:
+                    # DALI delivers augmented fp16 tensors already on the GPU
+                    inputs = batch[0]["images"].to(memory_format=torch.channels_last)
+                    labels = batch[0]["labels"].squeeze(-1).long().cpu()
+                else:
+                    # uint8 H2D copy, then augment + normalise on the GPU
+                    inputs = batch[0].to(device, non_blocking=True)
+                    inputs = gpu_augment(inputs).to(memory_format=torch.channels_last)
+                    labels = batch[1]
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=USE_AMP):
+                    feats = model.avgpool(backbone(inputs)).flatten(1)
+                feature_chunks.append(feats.half().cpu())
+                label_chunks.append(labels)
+
+    X = torch.cat(feature_chunks)
+    y = torch.cat(label_chunks)
+    print(f"✅ Cached {len(X)} embeddings ({X.shape[1]}-d float16, "
+          f"{X.element_size() * X.nelement() / 1e6:.1f}MB) in {time.time() - cache_start:.0f}s")
+
+    # The cache fits in RAM, so no worker processes needed here
+    head_loader = torch.utils.data.DataLoader(
+        torch.utils.data.TensorDataset(X, y),
+        batch_size=HEAD_BATCH_SIZE,
+        shuffle=True,
+    )
+else:
+    print("\n🔓 Backbone unfrozen - fine-tuning end-to-end with gradient checkpointing.")
+
+# --- 6. TRAIN WITH EARLY STOPPING ---
 criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.classifier.parameters(), lr=0.001)
+# fused=True runs the whole Adam update as one multi-tensor CUDA kernel
+# instead of a launch per parameter tensor (only supported on CUDA params)
+trainable_params = (
+    model.parameters() if UNFREEZE_BACKBONE else model.classifier.parameters()
+)
+optimizer = optim.Adam(trainable_params, lr=0.001, fused=device.type == "cuda")
+scaler = torch.cuda.amp.GradScaler(enabled=USE_AMP)
+
+# Accumulation only matters on the image path; the cached-embedding head
+# already trains at HEAD_BATCH_SIZE per step
+accum = ACCUM_STEPS if UNFREEZE_BACKBONE else 1
 
 print("\n🚀 STARTING TRAINING...")
 start_time = time.time()
 
 for epoch in range(EPOCHS):
     model.train()
-    running_loss = 0.0
-    correct = 0
+    # Accumulate on-device: .item() forces a CUDA sync, so calling it per
+    # batch serialises the pipeline. One sync per epoch is enough.
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), device=device, dtype=torch.long)
     total = 0
 
-    for inputs, labels in dataloader:
-        inputs, labels = inputs.to(device), labels.to(device)
-        optimizer.zero_grad()
-        outputs = model(inputs)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
+    # set_to_none releases the grad tensors instead of memset-ing zeros
+    optimizer.zero_grad(set_to_none=True)
+    for step, batch in enumerate(dataloader if UNFREEZE_BACKBONE else head_loader):
+        if UNFREEZE_BACKBONE:
+            inputs = batch[0].to(device, non_blocking=True)
+            inputs = gpu_augment(inputs).to(memory_format=torch.channels_last)
+        else:
+            inputs = batch[0].to(device, non_blocking=True).float()
+        labels = batch[1].to(device, non_blocking=True)
+
+        # Forward in FP16 under autocast; GradScaler rescales the loss so
+        # small gradients don't underflow in half precision
+        with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=USE_AMP):
+            if UNFREEZE_BACKBONE:
+                # Checkpointed backbone forward: activations are dropped and
+                # recomputed in backward, trading ~20% compute for the memory
+                # that otherwise caps batch size. segments=4 ~ the sqrt(n)
+                # sweet spot for the 13-block feature stack.
+                feat = checkpoint_sequential(
+                    model.features, 4, inputs, use_reentrant=False
+                )
+                outputs = model.classifier(model.avgpool(feat).flatten(1))
+            else:
+                outputs = model.classifier(inputs)
+            loss = criterion(outputs, labels)
+        # Divide by accum so the summed micro-batch gradients average out to
+        # one effective-batch gradient; step only on the accumulation boundary
+        scaler.scale(loss / accum).backward()
+        if (step + 1) % accum == 0:
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad(set_to_none=True)
 
-        running_loss += loss.item() * inputs.size(0)
+        running_loss += loss.detach() * labels.size(0)
         _, predicted = torch.max(outputs, 1)
         total += labels.size(0)
-        correct += (predicted == labels).sum().item()
+        correct += (predicted == labels).sum()
 
-    epoch_loss = running_loss / len(image_dataset)
-    epoch_acc = correct / total
+    # Normalise by the samples actually seen (drop_last skips the short batch)
+    epoch_loss = running_loss.item() / total
+    epoch_acc = correct.item() / total
 
     print(f"Epoch {epoch+1}/{EPOCHS} | Loss: {epoch_loss:.4f} | Accuracy: {epoch_acc:.4f}")
 
@@ -96,7 +343,7 @@ for epoch in range(EPOCHS):
 time_elapsed = time.time() - start_time
 print(f"\n✅ Finished in {time_elapsed // 60:.0f}m {time_elapsed % 60:.0f}s")
 
-# --- 6. SAVE & DOWNLOAD ---
+# --- 7. SAVE & DOWNLOAD ---
 torch.save(model.state_dict(), MODEL_SAVE_NAME)
 try:
     from google.colab import files
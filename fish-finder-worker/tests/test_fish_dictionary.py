@@ -60,3 +60,36 @@ class TestFishDictionary:
         for species, data in FISH_DATA.items():
             assert len(data["name"]) > 0, f"{species}: Hebrew name is empty"
             assert len(data["description"]) > 0, f"{species}: description is empty"
+
+
+class TestPrecomputedLookups:
+    """Import-time lookups built at the bottom of fish_dictionary.py."""
+
+    def test_species_list_is_sorted_and_complete(self):
+        from fish_dictionary import SPECIES_LIST
+        assert SPECIES_LIST == tuple(sorted(FISH_DATA.keys()))
+
+    def test_fish_records_align_with_species_list(self):
+        from fish_dictionary import SPECIES_LIST, FISH_RECORDS
+        assert len(FISH_RECORDS) == len(SPECIES_LIST)
+        for species, record in zip(SPECIES_LIST, FISH_RECORDS):
+            assert record is FISH_DATA[species]
+
+    def test_min_size_display_covers_all_species(self):
+        from fish_dictionary import MIN_SIZE_DISPLAY
+        for species, data in FISH_DATA.items():
+            min_size = data["regulations"]["min_size_cm"]
+            if min_size is None:
+                assert MIN_SIZE_DISPLAY[species] == "אין גודל מינימלי"
+            else:
+                assert MIN_SIZE_DISPLAY[species] == f"{min_size} ס״מ"
+
+    def test_sns_templates_substitute_only_confidence(self):
+        from fish_dictionary import SNS_SUBJECT, SNS_TEMPLATE
+        for species, data in FISH_DATA.items():
+            message = SNS_TEMPLATE[species] % "95%"
+            assert data["name"] in message
+            assert species in message
+            assert "ביטחון: 95%" in message
+            assert data["regulations"]["notes"] in message
+            assert SNS_SUBJECT[species] == f"תוצאה: {data['name']}"
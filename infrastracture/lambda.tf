@@ -49,7 +49,9 @@ resource "aws_lambda_function" "ml_worker" {
   image_uri     = "${aws_ecr_repository.ml_worker.repository_url}:latest"
   role          = aws_iam_role.lambda_worker_role.arn
   timeout       = 60   # 1 min - inference takes ~3-5s, 60s gives plenty of margin
-  memory_size   = 1536 # MB - PyTorch CPU needs ~1.5GB to load model + run inference
+  memory_size   = 1769 # MB - PyTorch CPU needs ~1.5GB; 1769MB = exactly 1 vCPU, and
+  # model_logic.py sizes its torch thread pool from this value, so keep the
+  # memory on a whole-vCPU boundary (multiples of 1769MB) when resizing.
 
   # Cap concurrent invocations to prevent billing spikes.
   # Excess SQS messages wait in the queue until a slot opens.
@@ -72,6 +74,13 @@ resource "aws_lambda_function" "ml_worker" {
 resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   event_source_arn = aws_sqs_queue.fish_queue.arn
   function_name    = aws_lambda_function.ml_worker.arn
-  batch_size       = 1 # One image per Lambda invocation
   enabled          = true
+
+  # Process up to 10 images per invocation - spreads the ~10-15s model load of
+  # a cold start over the whole batch instead of paying it per image. The
+  # handler reports per-record failures (batchItemFailures), so SQS retries
+  # only the records that actually failed, not the whole batch.
+  batch_size                         = 10
+  maximum_batching_window_in_seconds = 2
+  function_response_types            = ["ReportBatchItemFailures"]
 }
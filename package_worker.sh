@@ -32,7 +32,7 @@ REQUIRED=(
     "$WORKER_DIR/scripts/ec2_worker.py"
     "$WORKER_DIR/scripts/model_logic.py"
     "$WORKER_DIR/scripts/fish_dictionary.py"
-    "$WORKER_DIR/models/israel_med_fish_v1.pth"
+    "$WORKER_DIR/models/israel_med_fish_v3small_v1.pth"
     "$WORKER_DIR/scripts/setup_env.sh"
 )
 for file in "${REQUIRED[@]}"; do
@@ -43,13 +43,28 @@ for file in "${REQUIRED[@]}"; do
     echo "  ✅ Found:   $file"
 done
 
+# Pre-trace the model so workers cold-start via torch.jit.load instead of
+# rebuilding the architecture and re-tracing on every startup. Skipped with
+# a warning when torch isn't installed locally - the worker then falls back
+# to tracing at startup as before.
+TRACED="$WORKER_DIR/models/israel_med_fish_v3small_v1.ts"
+if [ ! -f "$TRACED" ]; then
+    echo ""
+    echo "Generating traced TorchScript model..."
+    if (cd "$WORKER_DIR/scripts" && python3 -c "from model_logic import FishClassifier; FishClassifier().export_traced()"); then
+        echo "  ✅ Traced model created: $TRACED"
+    else
+        echo "  ⚠️ Could not pre-trace (torch/cv2 missing?) - workers will trace at startup."
+    fi
+fi
+
 # Clean up any previous staging directory
 rm -rf "$STAGING"
 
 # Build the staging structure that mirrors what EC2 expects:
 #   ~/fish-finder-worker/
 #   ├── scripts/   (ec2_worker.py, model_logic.py, fish_dictionary.py)
-#   └── models/    (israel_med_fish_v1.pth)
+#   └── models/    (israel_med_fish_v3small_v1.pth)
 echo ""
 echo "Building staging directory..."
 mkdir -p "$STAGING/scripts"
@@ -58,13 +73,18 @@ mkdir -p "$STAGING/models"
 cp "$WORKER_DIR/scripts/ec2_worker.py"          "$STAGING/scripts/"
 cp "$WORKER_DIR/scripts/model_logic.py"         "$STAGING/scripts/"
 cp "$WORKER_DIR/scripts/fish_dictionary.py"     "$STAGING/scripts/"
-cp "$WORKER_DIR/models/israel_med_fish_v1.pth"  "$STAGING/models/"
+cp "$WORKER_DIR/models/israel_med_fish_v3small_v1.pth"  "$STAGING/models/"
 
 echo "  Staged: scripts/ec2_worker.py"
 echo "  Staged: scripts/model_logic.py"
 echo "  Staged: scripts/fish_dictionary.py"
-MODEL_SIZE=$(du -h "$STAGING/models/israel_med_fish_v1.pth" | cut -f1)
-echo "  Staged: models/israel_med_fish_v1.pth ($MODEL_SIZE)"
+MODEL_SIZE=$(du -h "$STAGING/models/israel_med_fish_v3small_v1.pth" | cut -f1)
+echo "  Staged: models/israel_med_fish_v3small_v1.pth ($MODEL_SIZE)"
+
+if [ -f "$TRACED" ]; then
+    cp "$TRACED" "$STAGING/models/"
+    echo "  Staged: models/israel_med_fish_v3small_v1.ts"
+fi
 
 # Create the archive from the staging directory
 echo ""
@@ -19,32 +19,104 @@ Then open http://localhost:5000 in your browser.
 
 import uuid
 import functools
+import hashlib
+import threading
+import time
 import requests
 import boto3
 import botocore
-from jose import jwt, JWTError
-from flask import Flask, jsonify, request, send_from_directory
+import orjson
+from cachetools import TTLCache
+from jose import jwk, jwt, JWTError
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import config
 
+
+def _json(data, status=200):
+    """
+    Serialize a response with orjson instead of flask.jsonify.
+
+    The polling endpoint is hit every few seconds per client and orjson is
+    several times faster than the stdlib json encoder on these payloads.
+    """
+    return Response(orjson.dumps(data), status=status, mimetype="application/json")
+
+
+# Shared HTTP session for JWKS fetches: a bare requests.get pays a fresh
+# TCP + TLS handshake every call. The pooled session keeps the connection
+# to Cognito alive and retries transient failures with backoff.
+_http = requests.Session()
+_http.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    ),
+)
+
 # ---------------------------------------------------------------------------
 # JWT verification (Cognito)
 # ---------------------------------------------------------------------------
-# Fetch Cognito's public keys once at startup and cache them.
-# These are used to verify the signature of every JWT sent by clients.
-_jwks_cache = None
-
+# Cognito's public keys, cached with a TTL instead of forever: when Cognito
+# rotates its signing keys a permanent cache would reject every new token
+# until the server restarts. The lock stops a thundering herd of worker
+# threads all hitting the JWKS endpoint on the first request after startup
+# (or after the hourly expiry).
+_jwks_cache = TTLCache(maxsize=1, ttl=3600)
+_jwks_lock = threading.Lock()
+
+# Cooldown for the unknown-kid forced refresh: without it, any request with a
+# fabricated kid triggers a synchronous Cognito fetch (with retries) while
+# holding _jwks_lock, stalling every other verification in the worker. Real
+# key rotations happen rarely, so one forced fetch a minute is plenty.
+_JWKS_FORCE_REFRESH_COOLDOWN = 60
+_jwks_last_forced = 0.0
+
+# Verified-token cache: clients poll /api/results every few seconds with the
+# same ID token, and the RS256 signature check is the most expensive CPU op
+# per request. Cache the decoded claims keyed by a 16-byte BLAKE2 hash of the
+# token (so raw tokens are never held in memory) and re-verify only after
+# expiry. exp is still enforced on every hit.
+_claims_cache = TTLCache(maxsize=1024, ttl=3600)
+
+
+def _get_jwks(force_refresh=False):
+    """
+    Fetch Cognito's JSON Web Key Set and return {kid: RSA key object}
+    (cached, refreshed hourly).
 
-def _get_jwks():
-    """Fetch and cache Cognito's JSON Web Key Set."""
-    global _jwks_cache
-    if _jwks_cache is None:
-        print(f"[Auth] Fetching JWKS from {config.COGNITO_JWKS_URL}")
-        resp = requests.get(config.COGNITO_JWKS_URL, timeout=5)
-        resp.raise_for_status()
-        _jwks_cache = resp.json()["keys"]
-    return _jwks_cache
+    The RSA keys are constructed once here rather than per request:
+    jwt.decode rebuilds the key from the raw JWK dict on every call
+    otherwise, and that big-number conversion is the expensive part.
+    """
+    global _jwks_last_forced
+    with _jwks_lock:
+        if force_refresh:
+            now = time.time()
+            if now - _jwks_last_forced < _JWKS_FORCE_REFRESH_COOLDOWN:
+                # A forced refresh just happened - a still-unknown kid is a
+                # bogus token, not a rotation. Serve the cached set.
+                force_refresh = False
+            else:
+                _jwks_last_forced = now
+        if force_refresh:
+            _jwks_cache.pop("keys", None)
+        keys_by_kid = _jwks_cache.get("keys")
+        if keys_by_kid is None:
+            print(f"[Auth] Fetching JWKS from {config.COGNITO_JWKS_URL}")
+            resp = _http.get(config.COGNITO_JWKS_URL, timeout=5)
+            resp.raise_for_status()
+            keys_by_kid = {
+                k["kid"]: jwk.construct(k, k.get("alg", "RS256"))
+                for k in resp.json()["keys"]
+            }
+            _jwks_cache["keys"] = keys_by_kid
+        return keys_by_kid
 
 
 def verify_token(token: str) -> dict:
@@ -52,14 +124,26 @@ def verify_token(token: str) -> dict:
     Verify a Cognito JWT and return the decoded claims.
     Raises JWTError if the token is invalid or expired.
     """
+    # Fast path: this exact token was already verified. Skip the signature
+    # check but never serve claims past their exp.
+    token_hash = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _claims_cache.get(token_hash)
+    if cached is not None:
+        if cached.get("exp", 0) > time.time():
+            return cached
+        _claims_cache.pop(token_hash, None)
+
     # Decode without verification first to extract the key ID (kid)
     unverified_header = jwt.get_unverified_header(token)
     kid = unverified_header["kid"]
 
-    # Find the matching public key in the JWKS
-    jwks = _get_jwks()
-    public_key = next((k for k in jwks if k["kid"] == kid), None)
-    if not public_key:
+    # Find the matching public key in the JWKS. An unknown kid usually means
+    # Cognito rotated its keys since our last fetch - refresh once before
+    # giving up so rotation doesn't surface as a 401 cascade.
+    public_key = _get_jwks().get(kid)
+    if public_key is None:
+        public_key = _get_jwks(force_refresh=True).get(kid)
+    if public_key is None:
         raise JWTError(f"Public key not found for kid: {kid}")
 
     # Verify signature, expiry, and audience
@@ -69,6 +153,7 @@ def verify_token(token: str) -> dict:
         algorithms=["RS256"],
         options={"verify_aud": False},  # Cognito ID tokens don't use 'aud' in all flows
     )
+    _claims_cache[token_hash] = claims
     return claims
 
 
@@ -82,13 +167,13 @@ def require_auth(f):
     def decorated(*args, **kwargs):
         auth_header = request.headers.get("Authorization", "")
         if not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Missing or invalid Authorization header"}), 401
+            return _json({"error": "Missing or invalid Authorization header"}, 401)
         token = auth_header[len("Bearer ") :]
         try:
             request.user = verify_token(token)
         except JWTError as e:
             print(f"[Auth] Token rejected: {e}")
-            return jsonify({"error": "Invalid or expired token"}), 401
+            return _json({"error": "Invalid or expired token"}, 401)
         return f(*args, **kwargs)
 
     return decorated
@@ -108,6 +193,40 @@ s3 = boto3.client("s3", region_name=config.AWS_REGION)
 dynamodb = boto3.resource("dynamodb", region_name=config.AWS_REGION)
 table = dynamodb.Table(config.DYNAMODB_TABLE)
 
+# Ready results are immutable once the worker writes them, but clients keep
+# polling after the first ready response. Serving repeats from memory skips
+# the DynamoDB round-trip (and its RCU cost) for up to 10k recent images;
+# pending lookups are never cached so a result still appears immediately.
+_results_cache = TTLCache(maxsize=10_000, ttl=300)
+
+# Cached presigned POST policy for uploads. The signature only depends on the
+# bucket, expiry window, and policy conditions - not on the object key - so
+# one policy signed with a ["starts-with", "$key", "uploads/"] condition
+# covers every upload; each request just substitutes its unique key into the
+# form fields. That takes the per-request HMAC signing and policy-JSON
+# construction off the hot path.
+_upload_policy = None  # (refresh_after_ts, presigned dict)
+_upload_policy_lock = threading.Lock()
+
+
+def _get_upload_policy():
+    """Return a presigned POST policy valid for any key under uploads/."""
+    global _upload_policy
+    with _upload_policy_lock:
+        if _upload_policy is None or time.time() >= _upload_policy[0]:
+            presigned = s3.generate_presigned_post(
+                Bucket=config.S3_BUCKET,
+                Key="uploads/${filename}",
+                Conditions=[["starts-with", "$key", "uploads/"]],
+                ExpiresIn=config.PRESIGNED_URL_EXPIRY_SECONDS,
+            )
+            # Re-sign at half the expiry so a client always receives a policy
+            # with at least half its upload window remaining
+            refresh_after = time.time() + config.PRESIGNED_URL_EXPIRY_SECONDS / 2
+            _upload_policy = (refresh_after, presigned)
+        return _upload_policy[1]
+
+
 print("[Fish Finder API] Starting up")
 print(f"  Region:       {config.AWS_REGION}")
 print(f"  S3 Bucket:    {config.S3_BUCKET}")
@@ -139,7 +258,7 @@ def get_config():
     None of these values are secret - they're safe to expose publicly
     (Cognito security relies on the password, not on hiding the pool ID).
     """
-    return jsonify(
+    return _json(
         {
             "region": config.AWS_REGION,
             "pool_id": config.COGNITO_POOL_ID,
@@ -179,28 +298,28 @@ def get_upload_url():
     # Use a UUID as the S3 key to avoid collisions and make polling unambiguous
     image_id = f"uploads/{uuid.uuid4()}.{extension}"
 
-    print(f"[API] Generating presigned URL for: {image_id}")
+    print(f"[API] Issuing upload URL for: {image_id}")
 
     try:
-        presigned = s3.generate_presigned_post(
-            Bucket=config.S3_BUCKET,
-            Key=image_id,
-            ExpiresIn=config.PRESIGNED_URL_EXPIRY_SECONDS,
-        )
-        return jsonify(
+        # Reuse the cached starts-with policy; only the key differs per upload
+        presigned = _get_upload_policy()
+        fields = dict(presigned["fields"])
+        fields["key"] = image_id
+        return _json(
             {
                 "image_id": image_id,
                 "upload_url": presigned["url"],
-                "fields": presigned["fields"],
+                "fields": fields,
             }
         )
     except botocore.exceptions.ClientError as e:
         print(f"[API] ❌ Failed to generate presigned URL: {e}")
-        return jsonify(
+        return _json(
             {
                 "error": "Could not generate upload URL. Check AWS credentials and S3 bucket config."
-            }
-        ), 500
+            },
+            500,
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -236,15 +355,31 @@ def get_results(image_id):
     """
     print(f"[API] Polling results for: {image_id}")
 
+    # Ready results never change - serve repeat polls from memory
+    cached = _results_cache.get(image_id)
+    if cached is not None:
+        return _json(cached)
+
+    # Eventually consistent read costs half an RCU, and the worst case is one
+    # extra "pending" poll cycle. The projection keeps the transfer down to
+    # the attributes this response actually uses - the worker stores more
+    # (Confidence, NeedsReview, MinSizeDisplay) that the API never returns.
     try:
-        response = table.get_item(Key={"ImageId": image_id})
+        response = table.get_item(
+            Key={"ImageId": image_id},
+            ConsistentRead=False,
+            ProjectionExpression=(
+                "Species, HebrewName, NativeStatus, Population, "
+                "AvgSizeCM, MinSizeCM, SeasonalBan, Notes, Description"
+            ),
+        )
     except botocore.exceptions.ClientError as e:
         print(f"[API] ❌ DynamoDB error: {e}")
-        return jsonify({"error": "Could not query results database."}), 500
+        return _json({"error": "Could not query results database."}, 500)
 
     if "Item" not in response:
         # Worker hasn't processed it yet - client should keep polling
-        return jsonify({"status": "pending"})
+        return _json({"status": "pending"})
 
     item = response["Item"]
 
@@ -252,26 +387,34 @@ def get_results(image_id):
     def safe_int(val, default=0):
         return int(val) if val is not None else default
 
-    return jsonify(
-        {
-            "status": "ready",
-            "species": item.get("Species", ""),
-            "hebrew_name": item.get("HebrewName", ""),
-            "native": item.get("NativeStatus", ""),
-            "population": item.get("Population", ""),
-            "avg_size_cm": safe_int(item.get("AvgSizeCM")),
-            "min_size_cm": safe_int(item.get("MinSizeCM")),
-            "seasonal_ban": bool(item.get("SeasonalBan", False)),
-            "notes": item.get("Notes", ""),
-            "description": item.get("Description", ""),
-        }
-    )
+    result = {
+        "status": "ready",
+        "species": item.get("Species", ""),
+        "hebrew_name": item.get("HebrewName", ""),
+        "native": item.get("NativeStatus", ""),
+        "population": item.get("Population", ""),
+        "avg_size_cm": safe_int(item.get("AvgSizeCM")),
+        "min_size_cm": safe_int(item.get("MinSizeCM")),
+        "seasonal_ban": bool(item.get("SeasonalBan", False)),
+        "notes": item.get("Notes", ""),
+        "description": item.get("Description", ""),
+    }
+    _results_cache[image_id] = result
+    return _json(result)
 
 
 # ---------------------------------------------------------------------------
 # Entry point
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
+    # Warm the JWKS cache before serving so the first authenticated request
+    # doesn't pay the Cognito round-trip. Non-fatal: a dev machine without
+    # network access still gets the lazy fetch on first use.
+    try:
+        _get_jwks()
+    except requests.RequestException as e:
+        print(f"[Auth] ⚠️ JWKS warmup failed (will retry lazily): {e}")
+
     # debug=True enables auto-reload on code changes during development.
     # Set debug=False (or use a proper WSGI server like gunicorn) in production.
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,42 @@
+"""
+gunicorn_conf.py - production server config for the Fish Finder API.
+
+Launch with:
+    gunicorn -c gunicorn_conf.py app:app
+
+The dev server (python app.py) is single-threaded, so every /api/results
+poll blocks on its DynamoDB round-trip. gevent workers multiplex those
+I/O-bound requests onto greenlets - boto3 sessions are thread-safe and
+botocore releases the GIL around socket I/O, so a handful of workers
+handles hundreds of concurrent polling clients.
+"""
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+
+worker_class = "gevent"
+# The gevent rule of thumb: enough workers to use every core, with the
+# greenlets inside each worker absorbing the I/O concurrency.
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_connections = 1000
+
+# Polling clients reconnect every few seconds - keep their connections open
+keepalive = 30
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """
+    Warm each worker's JWKS cache right after fork, so no worker pays the
+    Cognito round-trip on its first authenticated request. (The equivalent
+    warmup in app.py's __main__ block only covers the dev server.)
+    """
+    import requests
+    from app import _get_jwks
+
+    try:
+        _get_jwks()
+    except requests.RequestException as e:
+        worker.log.warning("JWKS warmup failed (will retry lazily): %s", e)
@@ -54,6 +54,8 @@ echo "[2/5] Installing Python dependencies..."
     flask==3.0.3 flask-cors==4.0.1 \
     boto3==1.34.144 botocore==1.34.144 \
     python-jose[cryptography]==3.3.0 \
+    cachetools==5.3.3 orjson==3.10.6 \
+    gunicorn==22.0.0 gevent==24.2.1 \
     requests==2.32.0 -q
 echo "      ✅ Dependencies installed."
 
@@ -86,7 +88,7 @@ Type=simple
 User=ubuntu
 WorkingDirectory=$WEBAPP_DIR
 EnvironmentFile=$WEBAPP_DIR/.env
-ExecStart=$WEBAPP_DIR/venv/bin/python app.py
+ExecStart=$WEBAPP_DIR/venv/bin/gunicorn -c gunicorn_conf.py app:app
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -21,6 +21,12 @@ def mock_aws(monkeypatch):
     mock_table = MagicMock()
     mock_dynamodb.Table.return_value = mock_table
 
+    # Clear the in-process caches so tests can't see each other's data
+    import app as app_module
+
+    app_module._results_cache.clear()
+    app_module._upload_policy = None
+
     with patch("app.s3", mock_s3), patch("app.dynamodb", mock_dynamodb), patch("app.table", mock_table):
         yield {"s3": mock_s3, "dynamodb": mock_dynamodb, "table": mock_table}
 
@@ -110,6 +116,19 @@ class TestGetUploadUrl:
         data = json.loads(resp.data)
         assert data["image_id"].endswith(".jpg")
 
+    def test_policy_signed_once_per_window(self, client, auth_header, mock_aws):
+        """The starts-with policy is reused; only the key differs per upload."""
+        mock_aws["s3"].generate_presigned_post.return_value = {
+            "url": "https://test-bucket.s3.amazonaws.com/",
+            "fields": {"policy": "abc123"},
+        }
+        first = json.loads(client.get("/api/upload-url", headers=auth_header).data)
+        second = json.loads(client.get("/api/upload-url", headers=auth_header).data)
+        assert mock_aws["s3"].generate_presigned_post.call_count == 1
+        assert first["image_id"] != second["image_id"]
+        assert first["fields"]["key"] == first["image_id"]
+        assert second["fields"]["key"] == second["image_id"]
+
 
 # --------------------------------------------------------------------------
 # GET /api/results/<image_id> (auth required)
@@ -149,3 +168,20 @@ class TestGetResults:
         assert data["hebrew_name"] == "דניס (צ׳יפורה)"
         assert data["avg_size_cm"] == 35
         assert data["seasonal_ban"] is False
+
+    def test_ready_result_served_from_cache(self, client, auth_header, mock_aws):
+        """Repeat polls after a ready result should not hit DynamoDB again."""
+        mock_aws["table"].get_item.return_value = {
+            "Item": {"ImageId": "uploads/test.jpg", "Species": "Sparus aurata"}
+        }
+        first = client.get("/api/results/uploads/test.jpg", headers=auth_header)
+        second = client.get("/api/results/uploads/test.jpg", headers=auth_header)
+        assert json.loads(first.data) == json.loads(second.data)
+        assert mock_aws["table"].get_item.call_count == 1
+
+    def test_pending_result_not_cached(self, client, auth_header, mock_aws):
+        """Pending lookups must keep querying DynamoDB until the result lands."""
+        mock_aws["table"].get_item.return_value = {}
+        client.get("/api/results/uploads/test.jpg", headers=auth_header)
+        client.get("/api/results/uploads/test.jpg", headers=auth_header)
+        assert mock_aws["table"].get_item.call_count == 2